@@ -4,10 +4,12 @@ Slim Gemini CLI Hook System - Token-Efficient Automation
 Optimized for Claude Code token savings with essential analysis only
 """
 
+import json
 import os
+import selectors
+import stat
 import subprocess
 import sys
-from pathlib import Path
 
 # Model configuration with environment variable support
 GEMINI_MODELS = {
@@ -29,57 +31,158 @@ SLIM_CONFIG = {
     "max_file_size": 81920,  # 80 KB
     "max_lines": 800,  # Maximum lines per file
     "response_word_limit": 800,  # Maximum words in response
-    "supported_extensions": [
-        ".py",
-        ".js",
-        ".ts",
-        ".java",
-        ".cpp",
-        ".c",
-        ".rs",  # Programming languages
-        ".vue",
-        ".html",
-        ".css",
-        ".scss",
-        ".sass",
-        ".jsx",
-        ".tsx",  # Frontend files
-    ],
+    "supported_extensions": frozenset(
+        {
+            ".py",
+            ".js",
+            ".ts",
+            ".java",
+            ".cpp",
+            ".c",
+            ".rs",  # Programming languages
+            ".vue",
+            ".html",
+            ".css",
+            ".scss",
+            ".sass",
+            ".jsx",
+            ".tsx",  # Frontend files
+        }
+    ),
 }
 
+# Files rejected on content, keyed by absolute path -> [mtime_ns, size, reason]
+REJECT_CACHE_PATH = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "slim_gemini",
+    "rejects.json",
+)
+REJECT_CACHE_MAX_ENTRIES = 1000  # Oldest entries are dropped beyond this
+_reject_cache = None
+_reject_cache_dirty = False
+
 # File validation
 
 
-def should_analyze_file(file_path: str) -> tuple[bool, str]:
-    """Determine if file should be analyzed based on slim configuration"""
+def load_reject_cache() -> dict:
+    """Load the persistent reject cache once per hook invocation"""
+    global _reject_cache
+    if _reject_cache is None:
+        try:
+            with open(REJECT_CACHE_PATH, "rb") as f:
+                _reject_cache = json.loads(f.read())
+        except (OSError, ValueError):
+            _reject_cache = {}
+        # A corrupt cache must never change a decision; start over instead
+        if not isinstance(_reject_cache, dict):
+            _reject_cache = {}
+    return _reject_cache
+
+
+def _is_valid_reject_entry(entry) -> bool:
+    """Check a cache entry has the [mtime_ns, size, reason] shape"""
+    return (
+        isinstance(entry, list)
+        and len(entry) == 3
+        and isinstance(entry[0], int)
+        and isinstance(entry[1], int)
+        and isinstance(entry[2], str)
+    )
+
+
+def save_reject_cache():
+    """Persist the reject cache if this invocation changed it"""
+    global _reject_cache_dirty
+    if not _reject_cache_dirty:
+        return
+
+    # Cap the size; entries for deleted files are never hit (os.open fails first)
+    excess = len(_reject_cache) - REJECT_CACHE_MAX_ENTRIES
+    for path in list(_reject_cache)[: max(excess, 0)]:
+        del _reject_cache[path]
 
     try:
-        path = Path(file_path)
+        os.makedirs(os.path.dirname(REJECT_CACHE_PATH), exist_ok=True)
+        tmp_path = f"{REJECT_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(_reject_cache, f)
+        os.replace(tmp_path, REJECT_CACHE_PATH)
+        _reject_cache_dirty = False
+    except OSError as e:
+        print(f"⚠️ Could not save reject cache: {e}", file=sys.stderr)
 
-        # Check if file exists
-        if not path.exists():
-            return False, "File not found"
 
-        # Check file extension
-        if path.suffix.lower() not in SLIM_CONFIG["supported_extensions"]:
-            return False, "File type not supported"
+def should_analyze_file(file_path: str) -> tuple[bool, str]:
+    """Determine if file should be analyzed based on slim configuration"""
+    global _reject_cache_dirty
 
-        # Check file size (80KB limit)
-        file_size = path.stat().st_size
-        if file_size > SLIM_CONFIG["max_file_size"]:
-            return False, f"File too large ({file_size} bytes)"
+    # Check file extension first; it needs no filesystem access
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in SLIM_CONFIG["supported_extensions"]:
+        return False, "File type not supported"
 
-        # Check line count (800 line limit)
+    try:
+        # Open once and reuse the descriptor for metadata and contents
+        # (O_NONBLOCK keeps a FIFO from blocking before the S_ISREG check)
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                line_count = sum(1 for _ in f)
+            fd = os.open(file_path, os.O_RDONLY | os.O_CLOEXEC | os.O_NONBLOCK)
+        except FileNotFoundError:
+            return False, "File not found"
+        except OSError:
+            return False, "Cannot read file"
 
-            if line_count > SLIM_CONFIG["max_lines"]:
-                return False, f"Too many lines ({line_count})"
-        except Exception:
-            # If can't read file, skip analysis
+        try:
+            st = os.fstat(fd)
+            if not stat.S_ISREG(st.st_mode):
+                return False, "Not a regular file"
+
+            # Check file size (80KB limit)
+            max_size = SLIM_CONFIG["max_file_size"]
+            if st.st_size > max_size:
+                return False, f"File too large ({st.st_size} bytes)"
+
+            # Reuse an earlier rejection if the file is unchanged since then
+            cache_key = os.path.abspath(file_path)
+            cached = load_reject_cache().get(cache_key)
+            if cached is not None:
+                if _is_valid_reject_entry(cached) and cached[:2] == [
+                    st.st_mtime_ns,
+                    st.st_size,
+                ]:
+                    return False, cached[2]
+                del _reject_cache[cache_key]
+                _reject_cache_dirty = True
+
+            # Read the whole (size-capped) file in one syscall, no buffered text IO
+            try:
+                data = os.read(fd, max_size + 1)
+            except OSError:
+                # If can't read file, skip analysis
+                return False, "Cannot read file"
+        finally:
+            os.close(fd)
+
+        # Reject undecodable (binary) content, as a UTF-8 text read would
+        try:
+            data.decode("utf-8")
+        except UnicodeDecodeError:
             return False, "Cannot read file"
 
+        # Check line count (800 line limit), with universal newlines like text mode
+        line_count = (
+            data.count(b"\n")
+            + data.count(b"\r")
+            - data.count(b"\r\n")
+            + (bool(data) and not data.endswith((b"\n", b"\r")))
+        )
+        if line_count > SLIM_CONFIG["max_lines"]:
+            reason = f"Too many lines ({line_count})"
+            # Re-insert so the newest rejections survive the size cap
+            _reject_cache.pop(cache_key, None)
+            _reject_cache[cache_key] = [st.st_mtime_ns, st.st_size, reason]
+            _reject_cache_dirty = True
+            return False, reason
+
         return True, "Ready for analysis"
 
     except Exception as e:
@@ -88,6 +191,56 @@ def should_analyze_file(file_path: str) -> tuple[bool, str]:
 
 # Gemini CLI execution
 
+# Subprocess streaming configuration
+READ_CHUNK_SIZE = 131072  # Bytes per os.read on each pipe
+PROGRESS_EVERY_CHUNKS = 8  # Echo a progress line for every Nth chunk read
+
+
+def stream_process_output(process, show_progress: bool = False) -> tuple[str, str]:
+    """Drain an unbuffered binary Popen's stdout and stderr, decoding once at the end"""
+    stdout_chunks, stderr_chunks = [], []
+    buffers = {
+        process.stdout.fileno(): stdout_chunks,
+        process.stderr.fileno(): stderr_chunks,
+    }
+
+    # Wait on both pipes at once so a full stderr pipe can never stall the child
+    with selectors.DefaultSelector() as sel:
+        sel.register(process.stdout, selectors.EVENT_READ)
+        sel.register(process.stderr, selectors.EVENT_READ)
+
+        while sel.get_map():
+            for key, _ in sel.select(timeout=1.0):
+                chunk = os.read(key.fd, READ_CHUNK_SIZE)
+                if not chunk:
+                    sel.unregister(key.fileobj)
+                    continue
+                buffers[key.fd].append(chunk)
+
+                # Show progress to stderr, sampled rather than per line
+                if (
+                    show_progress
+                    and buffers[key.fd] is stdout_chunks
+                    and (len(stdout_chunks) - 1) % PROGRESS_EVERY_CHUNKS == 0
+                ):
+                    lines = chunk.splitlines()
+                    line = lines[0] if lines else b""
+                    line = line.decode("utf-8", errors="replace").strip()
+                    if line:
+                        print(
+                            f"📝 {line[:80]}{'...' if len(line) > 80 else ''}",
+                            file=sys.stderr,
+                        )
+
+    process.stdout.close()
+    process.stderr.close()
+    process.wait()
+
+    return (
+        b"".join(stdout_chunks).decode("utf-8", errors="replace"),
+        b"".join(stderr_chunks).decode("utf-8", errors="replace"),
+    )
+
 
 def execute_gemini_analysis(analysis_type: str, file_paths: str):
     """Execute Gemini CLI analysis with model selection and token-efficient prompts"""
@@ -100,6 +253,7 @@ def execute_gemini_analysis(analysis_type: str, file_paths: str):
             valid_files.append(file_path)
         else:
             print(f"⚠️ Skipping {file_path}: {reason}", file=sys.stderr)
+    save_reject_cache()
 
     if not valid_files:
         print("📝 No valid files to analyze", file=sys.stderr)
@@ -126,36 +280,18 @@ def execute_gemini_analysis(analysis_type: str, file_paths: str):
             ["gemini", "-m", model_name, "-p", prompt],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
+            bufsize=0,
         )
 
         # Stream output and show progress
-        output_lines = []
         print(f"🔍 {analysis_type} analysis in progress...", file=sys.stderr)
-
-        while True:
-            line = process.stdout.readline()
-            if line:
-                output_lines.append(line)
-                # Show progress to stderr
-                print(
-                    f"📝 {line.strip()[:80]}{'...' if len(line.strip()) > 80 else ''}",
-                    file=sys.stderr,
-                )
-            elif process.poll() is not None:
-                break
-
-        # Get remaining output
-        remaining_stdout, stderr = process.communicate()
-        if remaining_stdout:
-            output_lines.append(remaining_stdout)
+        stdout, stderr = stream_process_output(process, show_progress=True)
 
         # Create result object to match original interface
         result = subprocess.CompletedProcess(
             args=["gemini", "-p", prompt],
             returncode=process.returncode,
-            stdout="".join(output_lines),
+            stdout=stdout,
             stderr=stderr,
         )
 
@@ -193,30 +329,17 @@ def execute_session_summary(directory_path: str):
             ["gemini", "-m", model_name, "-p", prompt],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
+            bufsize=0,
         )
 
         # Stream output
-        output_lines = []
-
-        while True:
-            line = process.stdout.readline()
-            if line:
-                output_lines.append(line)
-            elif process.poll() is not None:
-                break
-
-        # Get remaining output
-        remaining_stdout, stderr = process.communicate()
-        if remaining_stdout:
-            output_lines.append(remaining_stdout)
+        stdout, stderr = stream_process_output(process)
 
         # Create result object
         result = subprocess.CompletedProcess(
             args=["gemini", "-p", prompt],
             returncode=process.returncode,
-            stdout="".join(output_lines),
+            stdout=stdout,
             stderr=stderr,
         )
 
@@ -8,10 +8,19 @@ Enumerates all Metasploit modules and filters them based on requirements:
 """
 
 import json
+import os
 import subprocess
 import re
-from collections import defaultdict
-from typing import Dict, List, Any
+import shutil
+import sys
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Pattern, Union
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the stdlib encoder
+    orjson = None
 
 # Top 10 technology/platform keywords for exploit/payload filtering
 TOP_TECHNOLOGIES = [
@@ -31,56 +40,293 @@ TOP_SERVICES = [
     'kerberos', 'winrm', 'wmi', 'powershell'
 ]
 
+# Keyword lists compiled into single alternations so each module is scanned once
+EXPLOIT_RE = re.compile('|'.join(map(re.escape, TOP_TECHNOLOGIES)), re.IGNORECASE)
+AUX_RE = re.compile('|'.join(map(re.escape, TOP_SERVICES)), re.IGNORECASE)
+
+# Maximum auxiliary modules kept after filtering
+AUX_LIMIT = 50
+
+# Per-type (filter regex, limit); types not listed keep every module
+MODULE_FILTERS = {
+    'exploit': (EXPLOIT_RE, None),
+    'payload': (EXPLOIT_RE, None),
+    'auxiliary': (AUX_RE, AUX_LIMIT),
+}
+
+
+# msfconsole search output lines that never carry a module path
+SKIP_PREFIXES = ('=', '[')
+SKIP_RE = re.compile(r'Matching Modules|Name|----')
+
+# Non-empty output lines, matched lazily so the output is never copied or split up front
+LINE_RE = re.compile(r'^[^\n]+', re.MULTILINE)
+
+# Metasploit install locations (apt package, omnibus installer); MSF_ROOT overrides
+MSF_ROOTS = [
+    os.getenv('MSF_ROOT', ''),
+    '/usr/share/metasploit-framework',
+    '/opt/metasploit-framework/embedded/framework',
+]
+
+# Module metadata caches written by msfconsole (user store) or shipped with the framework (db)
+METADATA_CACHE_PATHS = [
+    os.path.expanduser('~/.msf4/store/modules_metadata.json'),
+] + [os.path.join(root, 'db', 'modules_metadata_base.json') for root in MSF_ROOTS if root]
+
+# On-disk directory name for each module type under <root>/modules. payloads/ is left out:
+# it holds singles/stagers/stages/adapters whose file paths are not payload reference names
+# (staged payloads combine a stager and a stage), so payloads need the cache or msfconsole.
+MODULE_TYPE_DIRS = {
+    'encoder': 'encoders',
+    'evasion': 'evasion',
+    'nop': 'nops',
+    'post': 'post',
+    'exploit': 'exploits',
+    'auxiliary': 'auxiliary',
+}
+
+# External (non-Ruby) module extensions; these must also be executable to be modules
+EXTERNAL_MODULE_EXTENSIONS = ('.py', '.go')
 
-def run_msfconsole_command(command: str) -> str:
-    """Execute msfconsole command and return output"""
+# Numeric module ranks used by the metadata cache
+RANK_NAMES = {
+    0: 'manual',
+    100: 'low',
+    200: 'average',
+    300: 'normal',
+    400: 'good',
+    500: 'great',
+    600: 'excellent',
+}
+
+# Metadata cache indexed as {module_type: {ref_name: entry}}, loaded once on first use
+_MODULE_METADATA: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
+
+# msfconsole resolved once at startup; None when it is not installed
+MSFCONSOLE = shutil.which('msfconsole')
+
+# Environment variables forwarded to msfconsole besides PATH and HOME
+MSFCONSOLE_ENV_PASSTHROUGH = ['LANG', 'LC_ALL', 'GEM_HOME', 'GEM_PATH', 'BUNDLE_GEMFILE']
+
+# Marker echoed between batched commands so one msfconsole run can be split per type
+SECTION_SENTINEL = '===TYPE:{}==='
+
+
+def _msfconsole_env() -> Dict[str, str]:
+    """Minimal environment for msfconsole, keeping only what Ruby needs to locate its gems"""
+    env = {
+        'PATH': os.environ.get('PATH', os.defpath),
+        'HOME': os.environ.get('HOME', '/tmp'),
+    }
+    for name in MSFCONSOLE_ENV_PASSTHROUGH:
+        if name in os.environ:
+            env[name] = os.environ[name]
+    return env
+
+
+def run_msfconsole_command(command: Union[str, List[str]], timeout: int = 300) -> str:
+    """Execute one or more msfconsole commands in a single session and return output"""
+    if MSFCONSOLE is None:
+        print("msfconsole not found in PATH")
+        return ""
+    if isinstance(command, str):
+        description = command
+    else:
+        description = f"batch of {len(command)} commands"
+        command = '; '.join(command)
     try:
-        cmd = ['msfconsole', '-q', '-x', f'{command}; exit']
+        # -q: no banner, -n: skip database connection (search/info use the module cache)
+        cmd = [MSFCONSOLE, '-q', '-n', '-x', f'{command}; exit']
         result = subprocess.run(
             cmd,
-            capture_output=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             text=True,
-            timeout=300
+            timeout=timeout,
+            env=_msfconsole_env()
         )
         return result.stdout
     except subprocess.TimeoutExpired:
-        print(f"Command timed out: {command}")
+        print(f"Command timed out: {description}")
         return ""
     except Exception as e:
         print(f"Error running command: {e}")
         return ""
 
 
-def parse_module_list(output: str, module_type: str) -> List[str]:
-    """Parse msfconsole output to extract module paths"""
-    modules = []
-    lines = output.split('\n')
+def load_module_metadata() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Load the first available modules metadata cache and index it by module type"""
+    global _MODULE_METADATA
+    if _MODULE_METADATA is not None:
+        return _MODULE_METADATA
+
+    _MODULE_METADATA = {}
+    for cache_path in METADATA_CACHE_PATHS:
+        try:
+            with open(cache_path, 'rb') as f:
+                entries = (orjson.loads if orjson is not None else json.loads)(f.read())
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError) as e:
+            print(f"Error reading metadata cache {cache_path}: {e}")
+            continue
+
+        # A valid file with an unexpected shape is skipped like an unreadable one
+        if not isinstance(entries, dict):
+            print(f"Error reading metadata cache {cache_path}: expected a JSON object")
+            continue
+
+        for entry in entries.values():
+            if not isinstance(entry, dict):
+                continue
+            module_type = entry.get('type')
+            ref_name = entry.get('ref_name')
+            if module_type and ref_name:
+                _MODULE_METADATA.setdefault(module_type, {})[ref_name] = entry
+        print(f"Loaded module metadata from {cache_path}")
+        break
+
+    return _MODULE_METADATA
+
+
+def _scan_module_files(directory: str, prefix: str = '') -> Iterator[str]:
+    """Recursively yield relative paths (without extension) of module files under directory"""
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                name = entry.name
+                # Hidden entries are ignored, as the Ruby module loader does
+                if name.startswith('.'):
+                    continue
+                # DirEntry caches d_type from readdir, so no per-entry stat is needed
+                if entry.is_dir(follow_symlinks=False):
+                    yield from _scan_module_files(entry.path, f'{prefix}{name}/')
+                elif name.endswith('.rb'):
+                    yield f'{prefix}{name[:-3]}'
+                elif name.endswith(EXTERNAL_MODULE_EXTENSIONS):
+                    # External modules load only when executable; this keeps helper
+                    # libraries out, at the cost of a stat for these files only
+                    try:
+                        if entry.stat().st_mode & 0o111:
+                            yield f'{prefix}{os.path.splitext(name)[0]}'
+                    except OSError:
+                        continue
+    except OSError:
+        return
+
+
+def enumerate_via_filesystem(module_type: str) -> Optional[List[str]]:
+    """List modules of a type from the metadata cache or module tree, without msfconsole.
+
+    The tree walk picks up Ruby modules and executable external Python/Go modules; it is
+    not used for payloads (see MODULE_TYPE_DIRS). Returns None when no local source covers
+    the type so the caller can fall back to msfconsole.
+    """
+    metadata = load_module_metadata()
+    if module_type in metadata:
+        return list(metadata[module_type])
+
+    type_dir_name = MODULE_TYPE_DIRS.get(module_type)
+    if type_dir_name is None:
+        return None
+
+    for root in MSF_ROOTS:
+        if not root:
+            continue
+        type_dir = os.path.join(root, 'modules', type_dir_name)
+        if os.path.isdir(type_dir):
+            return sorted(set(_scan_module_files(type_dir)))
+
+    return None
+
+
+def parse_module_list(output: str, module_type: str, filter_re: Optional[Pattern[str]] = None,
+                      limit: Optional[int] = None) -> List[str]:
+    """Parse msfconsole output to extract module paths.
+
+    When filter_re is given only matching modules are kept, stopping once limit are found,
+    so filtering happens in the same pass as parsing.
+    """
+    # dict keys dedupe modules msfconsole lists more than once, preserving order
+    modules = {}
+    skip_line = SKIP_RE.search
+    keep = filter_re.search if filter_re is not None else None
+    prefix = f'{module_type}/'
+    plen = len(prefix)
     
-    for line in lines:
-        line = line.strip()
+    # Iterate lines lazily instead of materializing a list of every line
+    for match in LINE_RE.finditer(output):
+        line = match.group().strip()
         # Skip header lines, empty lines, and status messages
-        if not line or line.startswith('=') or line.startswith('['):
-            continue
-        if 'Matching Modules' in line or 'Name' in line or '----' in line:
+        if not line or line.startswith(SKIP_PREFIXES) or skip_line(line):
             continue
             
-        # Extract module path (first column)
-        parts = line.split()
-        if parts and '/' in parts[0]:
-            module_path = parts[0]
+        # Extract module path (first column); line is non-empty after strip
+        module_path = line.split(None, 1)[0]
+        if '/' in module_path:
             # Remove module type prefix if present
-            if module_path.startswith(f'{module_type}/'):
-                module_path = module_path[len(module_type)+1:]
-            modules.append(module_path)
+            if module_path.startswith(prefix):
+                module_path = module_path[plen:]
+            if keep is not None and not keep(module_path):
+                continue
+            modules[module_path] = None
+            if limit is not None and len(modules) >= limit:
+                break
     
-    return modules
+    return list(modules)
+
+
+def split_sections(output: str, module_types: List[str]) -> Dict[str, str]:
+    """Split batched msfconsole output into per-type blocks using the section sentinels"""
+    sections = {}
+    markers = [SECTION_SENTINEL.format(t) for t in module_types]
+    for i, module_type in enumerate(module_types):
+        start = output.find(markers[i])
+        if start == -1:
+            sections[module_type] = ''
+            continue
+        start += len(markers[i])
+        end = len(output)
+        for marker in markers[i + 1:]:
+            pos = output.find(marker, start)
+            if pos != -1:
+                end = pos
+                break
+        sections[module_type] = output[start:end]
+    return sections
+
+
+def module_info_from_metadata(entry: Dict[str, Any], module_path: str) -> Dict[str, Any]:
+    """Translate a modules metadata cache entry into the get_module_info shape"""
+    rank = entry.get('rank')
+    platform = entry.get('platform') or ''
+    return {
+        'path': module_path,
+        'name': entry.get('name') or '',
+        'description': ' '.join((entry.get('description') or '').split()),
+        'rank': RANK_NAMES.get(rank, '') if isinstance(rank, int) else str(rank or '').lower(),
+        'platform': [p.strip() for p in platform.split(',') if p.strip()],
+        'targets': list(entry.get('targets') or []),
+        'options': [],
+        'payloads': []
+    }
 
 
 def get_module_info(module_type: str, module_path: str) -> Dict[str, Any]:
     """Get detailed information about a specific module"""
+    entry = load_module_metadata().get(module_type, {}).get(module_path)
+    if entry is not None:
+        return module_info_from_metadata(entry, module_path)
+
     full_path = f"{module_type}/{module_path}"
     output = run_msfconsole_command(f"info {full_path}")
-    
+    return parse_module_info(output, module_path)
+
+
+def parse_module_info(output: str, module_path: str) -> Dict[str, Any]:
+    """Parse msfconsole `info` output for a single module"""
     info = {
         'path': module_path,
         'name': '',
@@ -92,12 +338,11 @@ def get_module_info(module_type: str, module_path: str) -> Dict[str, Any]:
         'payloads': []
     }
     
-    # Parse the output
-    lines = output.split('\n')
+    # Parse the output, iterating lines lazily
     current_section = None
     
-    for line in lines:
-        line = line.strip()
+    for match in LINE_RE.finditer(output):
+        line = match.group().strip()
         
         # Extract name
         if line.startswith('Name:'):
@@ -112,14 +357,15 @@ def get_module_info(module_type: str, module_path: str) -> Dict[str, Any]:
         
         # Extract rank
         elif 'Rank:' in line:
-            rank_match = re.search(r'Rank:\s+(\w+)', line)
-            if rank_match:
-                info['rank'] = rank_match.group(1).lower()
+            # Fixed "Rank:  <word>" format, so plain string ops suffice
+            tail = line.partition('Rank:')[2].strip()
+            if tail:
+                info['rank'] = tail.split(None, 1)[0].lower()
         
         # Extract platform
         elif 'Platform:' in line or 'Available targets:' in line:
             # Extract platform/target info
-            parts = line.split(':')
+            parts = line.split(':', 2)
             if len(parts) > 1:
                 platforms = parts[1].strip().split(',')
                 info['platform'].extend([p.strip() for p in platforms if p.strip()])
@@ -127,45 +373,50 @@ def get_module_info(module_type: str, module_path: str) -> Dict[str, Any]:
     return info
 
 
-def filter_exploits_payloads(modules: List[str]) -> List[str]:
-    """Filter exploit/payload modules by top 10 technologies"""
-    filtered = []
-    for module in modules:
-        module_lower = module.lower()
-        if any(tech in module_lower for tech in TOP_TECHNOLOGIES):
-            filtered.append(module)
-    return filtered
-
-
-def filter_auxiliary(modules: List[str]) -> List[str]:
-    """Filter auxiliary modules by top 50 services"""
-    filtered = []
-    for module in modules:
-        module_lower = module.lower()
-        if any(service in module_lower for service in TOP_SERVICES):
-            filtered.append(module)
-    
-    # Limit to top 50 if more found
-    return filtered[:50] if len(filtered) > 50 else filtered
+def _filter_modules(modules: Iterable[str], filter_re: Pattern[str],
+                    limit: Optional[int] = None) -> List[str]:
+    """Keep modules matching filter_re, stopping once limit are found"""
+    return list(islice(filter(filter_re.search, modules), limit))
 
 
 def organize_modules_by_category(modules: List[str]) -> Dict[str, List[str]]:
     """Organize modules by their category (first path component)"""
-    organized = defaultdict(list)
+    organized = {}
     
     for module in modules:
-        parts = module.split('/')
-        if len(parts) > 1:
-            category = parts[0]
-            organized[category].append(module)
-        else:
-            organized['other'].append(module)
+        # partition stops at the first separator instead of splitting the whole path
+        category, sep, _ = module.partition('/')
+        # Intern so every module in a category shares one key string
+        category = sys.intern(category) if sep else 'other'
+        organized.setdefault(category, []).append(module)
     
-    return dict(organized)
+    return organized
+
 
+def _enumerate_type(module_type: str, output: Optional[str] = None) -> Optional[List[str]]:
+    """List and filter modules of one type.
 
-def enumerate_all_modules() -> Dict[str, Any]:
-    """Enumerate all Metasploit modules with filtering"""
+    Parses output from a batched msfconsole search when given, otherwise reads local sources.
+    Returns the filtered modules, or None when no local source exists and msfconsole is
+    required.
+    """
+    # encoder, evasion, nop, post - keep all
+    filter_re, limit = MODULE_FILTERS.get(module_type, (None, None))
+
+    if output is not None:
+        return parse_module_list(output, module_type, filter_re, limit)
+
+    modules = enumerate_via_filesystem(module_type)
+    if modules is not None and filter_re is not None:
+        modules = _filter_modules(modules, filter_re, limit)
+    return modules
+
+
+def enumerate_all_modules() -> Optional[Dict[str, Any]]:
+    """Enumerate all Metasploit modules with filtering.
+
+    Returns None when some module types have no local source and msfconsole is not installed.
+    """
     print("Starting Metasploit module enumeration...")
     
     result = {
@@ -179,23 +430,42 @@ def enumerate_all_modules() -> Dict[str, Any]:
     
     module_types = ['encoder', 'evasion', 'nop', 'post', 'exploit', 'payload', 'auxiliary']
     
+    # Read module lists straight from the metadata cache or module tree
+    found = {module_type: _enumerate_type(module_type) for module_type in module_types}
+    missing = [module_type for module_type in module_types if found[module_type] is None]
+    
+    # Fall back to one msfconsole session for the rest; startup dominates each invocation
+    if missing and MSFCONSOLE is None:
+        print(
+            f"msfconsole not found in PATH and no local module source for: {', '.join(missing)}",
+            file=sys.stderr
+        )
+        return None
+    if missing:
+        commands = []
+        for module_type in missing:
+            commands.append(f"echo {SECTION_SENTINEL.format(module_type)}")
+            commands.append(f"search type:{module_type}")
+        print(f"\nSearching {len(missing)} module types in a single msfconsole session...")
+        sections = split_sections(
+            run_msfconsole_command(commands, timeout=300 * len(missing)),
+            missing
+        )
+        for module_type in missing:
+            found[module_type] = _enumerate_type(module_type, sections[module_type])
+    
     for module_type in module_types:
         print(f"\nEnumerating {module_type} modules...")
         
-        # Get all modules of this type
-        output = run_msfconsole_command(f"search type:{module_type}")
-        modules = parse_module_list(output, module_type)
+        # Filtering already happened while listing
+        modules = found[module_type]
         
-        print(f"Found {len(modules)} {module_type} modules")
-        
-        # Apply filtering
         if module_type in ['exploit', 'payload']:
-            modules = filter_exploits_payloads(modules)
-            print(f"Filtered to {len(modules)} {module_type} modules (top technologies)")
+            print(f"Found {len(modules)} {module_type} modules (top technologies)")
         elif module_type == 'auxiliary':
-            modules = filter_auxiliary(modules)
-            print(f"Filtered to {len(modules)} {module_type} modules (top services)")
-        # encoder, evasion, nop, post - keep all
+            print(f"Found {len(modules)} {module_type} modules (top services)")
+        else:
+            print(f"Found {len(modules)} {module_type} modules")
         
         # Organize by category
         organized = organize_modules_by_category(modules)
@@ -205,12 +475,43 @@ def enumerate_all_modules() -> Dict[str, Any]:
         result['metadata']['total_modules'] += len(modules)
     
     # Add timestamp
-    from datetime import datetime
-    result['metadata']['generated_at'] = datetime.utcnow().isoformat() + 'Z'
+    result['metadata']['generated_at'] = (
+        datetime.now(timezone.utc).isoformat(timespec='seconds').replace('+00:00', 'Z')
+    )
     
     return result
 
 
+# Output buffer for the module dump; sections are written as they are serialized
+WRITE_BUFFER_SIZE = 262144
+
+
+def _dumps(obj: Any) -> bytes:
+    """Serialize obj to compact JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def write_modules_json(modules_data: Dict[str, Any], output_path: str) -> None:
+    """Write modules data to output_path one module type at a time.
+
+    Each type's sub-dict is serialized independently, so peak memory is bounded by the
+    largest type rather than the whole document.
+    """
+    with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(b'{"metadata":')
+        f.write(_dumps(modules_data['metadata']))
+        f.write(b',"modules":{')
+        for i, (module_type, organized) in enumerate(modules_data['modules'].items()):
+            if i:
+                f.write(b',')
+            f.write(_dumps(module_type))
+            f.write(b':')
+            f.write(_dumps(organized))
+        f.write(b'}}')
+
+
 def main():
     """Main execution"""
     print("Metasploit Module Enumeration Script")
@@ -218,14 +519,16 @@ def main():
     
     # Enumerate modules
     modules_data = enumerate_all_modules()
+    if modules_data is None:
+        # Leave any existing output in place rather than writing an incomplete dump
+        return 1
     
     # Write to JSON file
     output_path = '/app/server/data/metasploit-modules.json'
     
     print(f"\nWriting results to {output_path}...")
     try:
-        with open(output_path, 'w') as f:
-            json.dump(modules_data, f, indent=2)
+        write_modules_json(modules_data, output_path)
         print(f"✓ Successfully wrote {modules_data['metadata']['total_modules']} modules")
         print("\nModules by type:")
         for module_type, count in modules_data['metadata']['by_type'].items():